@@ -1,14 +1,29 @@
 import google.genai as genai
 from google.genai import types
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+import asyncio
 import json
+import os
+
+# prefer orjson for the large JSON files, falling back to the standard library
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 '''model setup'''
 
-# set up the model (explicit api key for file portability)
+# set up the model lazily, on first use, with the api key taken from the
+# GOOGLE_API_KEY environment variable
 
-GOOGLE_API_KEY = "redacted"
-client = genai.Client(api_key = GOOGLE_API_KEY)
+_CLIENT = None
+
+def _client() -> genai.Client:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = genai.Client(api_key = os.environ["GOOGLE_API_KEY"])
+    return _CLIENT
 
 # set up an auxiliary augmented sastric name class
 
@@ -16,6 +31,9 @@ class AugmentedSastricName(BaseModel):
     """
     A data class for sastric names that Gemini finds.
     """
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=False,
+                              validate_assignment=False, extra='ignore')
+
     name: str
     definition: str
     context: str
@@ -23,6 +41,27 @@ class AugmentedSastricName(BaseModel):
     category: str
     gender: str
 
+# build the validator for the model's JSON output once
+
+_NAMES_ADAPTER = TypeAdapter(list[AugmentedSastricName])
+
+# set up helpers to read and write JSON files, with orjson when available
+
+def _read_json(json_file_path: str):
+    if orjson is not None:
+        with open(json_file_path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(json_file_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_json(json_file_path: str, data):
+    if orjson is not None:
+        with open(json_file_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with open(json_file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
 # set up a function to load names already found, from a JSON file
 
 def load_existing_names(json_file_path: str) -> list[str]:
@@ -36,11 +75,10 @@ def load_existing_names(json_file_path: str) -> list[str]:
         list[str]: List of existing name strings to exclude.
     """
     try:
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            existing_names = [item['name'] for item in data]
-            print(f"Loaded {len(existing_names)} existing names from {json_file_path}")
-            return existing_names
+        data = _read_json(json_file_path)
+        existing_names = [item['name'] for item in data]
+        print(f"Loaded {len(existing_names)} existing names from {json_file_path}")
+        return existing_names
     except FileNotFoundError:
         print(f"Warning: {json_file_path} not found. No existing names to exclude.")
         return []
@@ -48,58 +86,60 @@ def load_existing_names(json_file_path: str) -> list[str]:
         print(f"Error loading existing names: {e}")
         return []
 
-'''implement the name extracting function'''
+# cap on the number of names sent to the model as an exclusion list
 
-def extract_names(source_str, source_ref, exclude_names_file: str = None):
+MAX_EXCLUDED_NAMES = 2000
+
+def build_exclusion_text(existing_names: list[str]) -> str:
     """
-    A function that processes a sastric text input with its reference and retrieves
-    beautiful names from said input, excluding names that are already in a specified file.
+    Build the prompt section that tells the model which names to exclude,
+    so that it can be built once and reused across many prompts.
 
     Args:
-        source_str (str):         A string with all the source text including verse, 
-                                  synonyms, translation, and purport.
-        source_ref (str):         A string reference to the source text to guide the model
-                                  (ex. Srimad-Bhagavatam Canto 10, Chapter 1, Texts 1-10).
-        exclude_names_file (str): Optional path to a JSON file containing names to exclude.
+        existing_names (list[str]): Names already found, oldest first.
 
     Returns:
-        list[AugmentedSastricName]: 
-        A list of AugmentedSastricName objects, where each one represents 
-        a beautiful Sanskrit name found in the text and contains the
-        following keys:
-            - 'name' (str):              The actual beautiful Sanskrit name found, presented
-                                         in the nominative case.
-            - 'definition' (str):        The definition of the name.
-            - 'context' (str):           Relevant information illuminating where this name
-                                         comes from and how it's used, etc. This should be
-                                         especially comprehensive.
-            - 'references' (list[str]):  The specific verse number(s) or sections
-                                         (e.g., "SB 1.1.1, 1.1.12 Purport") pointing to
-                                         this name.
-            - 'category' (str):          The name criteria category this name falls under
-                                         (e.g., "Names of Krishna", "Qualities of Krishna's 
-                                         devotees").
-            - 'gender' (str):            The gender associated with this name ("Male", 
-                                         "Female", or "Neutral").
+        str: The exclusion instructions, or an empty string if there are
+        no names to exclude.
     """
 
-    # load existing names to exclude, if any
+    # deduplicate the names, keeping only the most recent ones
+
+    existing_names = list(dict.fromkeys(existing_names))
+    if len(existing_names) > MAX_EXCLUDED_NAMES:
+        existing_names = existing_names[-MAX_EXCLUDED_NAMES:]
+
+    if not existing_names:
+        return ""
 
-    existing_names = []
-    if exclude_names_file:
-        existing_names = load_existing_names(exclude_names_file)
-    
     # create exclusion list for the prompt
 
-    exclusion_text = ""
-    if existing_names:
-        exclusion_text = f"""IMPORTANT: DO NOT include any of the following names that have already been found:
+    exclusion_text = f"""IMPORTANT: DO NOT include any of the following names that have already been found:
         
-        {', '.join(existing_names)}
+        {', '.join(sorted(existing_names))}
         
         Please find ONLY NEW names that are not in the above list."""
 
-        print(exclusion_text)
+    print(exclusion_text)
+    print(f"Excluding {len(existing_names)} existing names from previous searches\n")
+
+    return exclusion_text
+
+'''implement the name extracting function'''
+
+def _build_prompt(source_str, source_ref, exclusion_text: str = ""):
+    """
+    Build the name extraction prompt for a source text.
+
+    Args:
+        source_str (str):     The source text to search for names.
+        source_ref (str):     A string reference to the source text.
+        exclusion_text (str): Optional exclusion instructions, as built by
+                              build_exclusion_text.
+
+    Returns:
+        str: The prompt.
+    """
 
     # set up the prompt
 
@@ -151,90 +191,124 @@ def extract_names(source_str, source_ref, exclude_names_file: str = None):
     present the name as the name itself in the correct Sanskrit declension, the 
     nominative case."""
 
-    first_prompt = f"{source_str} \n\n {command}"
+    return f"{source_str} \n\n {command}"
 
-    # initiate the response
+async def extract_names_async(source_str, source_ref, exclusion_text: str = ""):
+    """
+    A function that processes a sastric text input with its reference and retrieves
+    beautiful names from said input, excluding names that have already been found.
+    Calls the model asynchronously, so that several inputs can be processed concurrently.
 
-    print(f"\nBeautiful names from source: {source_ref}\n")
+    Args:
+        source_str (str):         A string with all the source text including verse, 
+                                  synonyms, translation, and purport.
+        source_ref (str):         A string reference to the source text to guide the model
+                                  (ex. Srimad-Bhagavatam Canto 10, Chapter 1, Texts 1-10).
+        exclusion_text (str):     Optional instructions listing names to exclude, as
+                                  built by build_exclusion_text.
+
+    Returns:
+        list[AugmentedSastricName]: 
+        A list of AugmentedSastricName objects, where each one represents 
+        a beautiful Sanskrit name found in the text and contains the
+        following keys:
+            - 'name' (str):              The actual beautiful Sanskrit name found, presented
+                                         in the nominative case.
+            - 'definition' (str):        The definition of the name.
+            - 'context' (str):           Relevant information illuminating where this name
+                                         comes from and how it's used, etc. This should be
+                                         especially comprehensive.
+            - 'references' (list[str]):  The specific verse number(s) or sections
+                                         (e.g., "SB 1.1.1, 1.1.12 Purport") pointing to
+                                         this name.
+            - 'category' (str):          The name criteria category this name falls under
+                                         (e.g., "Names of Krishna", "Qualities of Krishna's 
+                                         devotees").
+            - 'gender' (str):            The gender associated with this name ("Male", 
+                                         "Female", or "Neutral").
+    """
 
-    # print the exclusion information if there are existing names
+    prompt = _build_prompt(source_str, source_ref, exclusion_text)
 
-    if existing_names:
-        print(f"Excluding {len(existing_names)} existing names from previous searches\n")
+    # initiate the response
 
-    # calculate the model's first response
+    print(f"\nBeautiful names from source: {source_ref}\n")
 
-    first_response = client.models.generate_content(
+    # stream the model's response, allowing the model's full output budget
+    # (which also covers its thinking) to enumerate every name in one call,
+    # and collect the JSON text as it arrives
+
+    response_text = bytearray()
+    async for chunk in await _client().aio.models.generate_content_stream(
         model="gemini-2.5-pro", 
-        contents=first_prompt,
+        contents=prompt,
         config=types.GenerateContentConfig(
             temperature=0.0,
+            max_output_tokens=65536,
             response_mime_type="application/json",
             response_schema=list[AugmentedSastricName]
         )
-    )
+    ):
+        if chunk.text:
+            response_text += chunk.text.encode('utf-8')
 
-    # initialize the second prompt with the first response as a Content object
+    # print the response to the console
 
-    model_content_for_history = first_response.candidates[0].content
+    print(response_text.decode('utf-8'))
 
-    second_prompt = f"""
-    The above is the first response. Now, please continue to find more names
-    from the same source text, {source_ref}, that you have not already found.
-    Make sure to follow the same criteria as before, and DO NOT repeat any names
-    that you have already found in the first response. Format your output exactly
-    as before, with the name first, followed by the definition, context, references,
-    category. Then, add these to the previous response, so that you have a
-    comprehensive list of all the names you have found so far."""
+    # parse and validate the names straight from the JSON text
+    # (type explicitly specified as a reminder)
 
-    # create chat contents for the second response as a list of Contents made of Parts
+    found_names: list[AugmentedSastricName] = _NAMES_ADAPTER.validate_json(response_text)
+    return found_names
 
-    chat_contents = [
-        types.Content(role="user", parts=[types.Part(text=first_prompt)]),
-        model_content_for_history,
-        types.Content(role="user", parts=[types.Part(text=second_prompt)])
-    ]
+def extract_names(source_str, source_ref, exclusion_text: str = ""):
+    """
+    A blocking wrapper around extract_names_async, for processing a single
+    sastric text input. See extract_names_async for the arguments and
+    the returned names.
+    """
 
-    # calculate the model's second response
+    return asyncio.run(extract_names_async(source_str, source_ref, exclusion_text))
 
-    print("\nContinuing to find more names...\n")
+# store the output in a newline-delimited JSON file, appending as names are found
 
-    second_response = client.models.generate_content(
-        model="gemini-2.5-pro", 
-        contents=chat_contents,
-        config=types.GenerateContentConfig(
-            temperature=0.0,
-            response_mime_type="application/json",
-            response_schema=list[AugmentedSastricName]
-        )
-    )
+def extract_names_to_json(canto, chapter, found_names):
+    # append one JSON object per name, so earlier output is never rewritten
+    # (the names were just validated and hold only str and list[str] fields,
+    # so their field dictionaries serialize as-is without model_dump)
 
-    # print the second response to the console
+    with open(f'sb_canto{canto}_chapter{chapter}_names.ndjson', 'a', encoding='utf-8') as f:
+        for name in found_names:
+            f.write(json.dumps(name.__dict__, ensure_ascii=False) + "\n")
 
-    print(second_response.text)
+    # print the number of new names appended to the file
 
-    # return the names (type explicitly specified as a reminder)
+    print(f"Appended {len(found_names)} new entries to " \
+          f"sb_canto{canto}_chapter{chapter}_names.ndjson.")
 
-    found_names: list[AugmentedSastricName] = second_response.parsed
-    return found_names
+# merge the appended names into the chapter's JSON file, once per chapter
 
-# store the output in a JSON file
+def finalize_names_json(canto, chapter):
+    ndjson_path = f'sb_canto{canto}_chapter{chapter}_names.ndjson'
+    json_path = f'sb_canto{canto}_chapter{chapter}_names.json'
 
-def extract_names_to_json(canto, chapter, found_names):
-    # convert the pydantic models to dictionaries for JSON serialization
-    
-    names_data = [name.model_dump() for name in found_names]
+    # read the names appended during this run
 
-    # save the output to a JSON file
+    try:
+        with open(ndjson_path, 'r', encoding='utf-8') as f:
+            names_data = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        # if nothing was appended, there is nothing to merge
+        return
 
     try:
         # read existing content
-        with open(f'sb_canto{canto}_chapter{chapter}_names.json', 'r', encoding='utf-8') as f:
-            existing_data = json.load(f)
+        existing_data = _read_json(json_path)
     except FileNotFoundError:
         # if file doesn't exist, start with an empty list
         existing_data = []
-    except json.JSONDecodeError:
+    except ValueError:
         # if file is empty or malformed, start with an empty list
         existing_data = []
 
@@ -242,12 +316,12 @@ def extract_names_to_json(canto, chapter, found_names):
 
     existing_data.extend(names_data)
 
-    # write updated content back to the file
+    # write updated content back to the file, then drop the merged names
 
-    with open(f'sb_canto{canto}_chapter{chapter}_names.json', 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, indent=2, ensure_ascii=False)
+    _write_json(json_path, existing_data)
 
-    # print the number of new names appended to the file
+    os.remove(ndjson_path)
 
-    print(f"Appended {len(found_names)} new entries to " \
-          "sb_canto{canto}_chapter{chapter}_names.json.")
+    # print the number of new names merged into the file
+
+    print(f"Merged {len(names_data)} new entries into {json_path}.")
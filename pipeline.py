@@ -1,41 +1,165 @@
-import math as m, text_retriever, names_extractor
+import argparse, asyncio, hashlib, json, os, text_retriever, names_extractor
 
-def get_names_from_chapter(canto: int, chapter: int):
-    # retrieve the relevant texts and initialize limits
+# maximum number of concurrent requests to the model
+
+MAX_CONCURRENT_REQUESTS = 8
+
+# maximum number of chapters processed concurrently when running all of SB
+
+MAX_CONCURRENT_CHAPTERS = 8
+
+# number of texts fed to the model per request
+
+WINDOW_SIZE = 20
+
+async def extract_names_from_windows(source_strs: list[str], source_ref: str,
+                                     exclusion_text: str,
+                                     semaphore: asyncio.Semaphore = None):
+    # extract names from every window concurrently, capped by a semaphore
+    # (shared across chapters, if given) to respect rate limits, keeping
+    # the results in window order
+
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def extract(source_str):
+        async with semaphore:
+            return await names_extractor.extract_names_async(
+                source_str, source_ref, exclusion_text)
+
+    return await asyncio.gather(*(extract(source_str) for source_str in source_strs),
+                                return_exceptions=True)
+
+def load_progress(canto: int, chapter: int) -> dict:
+    # load the windows already completed for a chapter by earlier runs,
+    # along with hashes of their texts
+
+    try:
+        with open(f'sb_canto{canto}_chapter{chapter}_progress.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"completed_windows": [], "window_hashes": []}
+
+def mark_window_completed(canto: int, chapter: int, progress: dict,
+                          window: int, window_hash: str):
+    # record a completed window and flush it to disk, so that an
+    # interrupted run can skip it on restart
+
+    progress["completed_windows"].append(window)
+    progress["window_hashes"].append(window_hash)
+
+    with open(f'sb_canto{canto}_chapter{chapter}_progress.json', 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+def save_windows(canto: int, chapter: int, progress: dict, pending: list[int],
+                 window_hashes: list[str], all_found_names: list):
+    # extract names to JSON file, in window order, marking each window
+    # completed, and keeping the first failure to raise once the
+    # successful windows are saved
+
+    failure = None
+    for window, found_names in zip(pending, all_found_names):
+        if isinstance(found_names, BaseException):
+            failure = failure or found_names
+            continue
+        names_extractor.extract_names_to_json(canto, chapter, found_names)
+        mark_window_completed(canto, chapter, progress, window, window_hashes[window])
+
+    # merge the appended names into the chapter's JSON file
+
+    names_extractor.finalize_names_json(canto, chapter)
+
+    if failure is not None:
+        raise failure
+
+async def get_names_from_chapter_async(canto: int, chapter: int,
+                                       semaphore: asyncio.Semaphore = None,
+                                       texts: list[str] = None):
+    # retrieve the relevant texts, unless already fetched, and initialize limits
 
     source_ref = f"Srimad Bhagavatam, Canto {canto}, Chapter {chapter}"
     exclude_names_file = f'sb_canto{canto}_chapter{chapter}_names.json'
-    texts = text_retriever.get_texts_from_chapter(canto, chapter)
-    curr_iter, max_iter = 0, m.ceil(len(texts) / 20)
-    
-    # payload concatenation
+    if texts is None:
+        texts = text_retriever.get_texts_from_chapter(canto, chapter)
 
-    while curr_iter < max_iter:
-        # refresh the step size
+    # load the names already found once, and share the exclusion list
+    # across every window of the chapter
 
-        start_index = 20 * curr_iter
-        step = min(20, len(texts) - start_index)
+    existing_names = names_extractor.load_existing_names(exclude_names_file)
+    exclusion_text = names_extractor.build_exclusion_text(existing_names)
 
-        # feed into name extractor
+    # payload concatenation, building every 20-text window once up front
 
-        source_str = ' '.join(texts[start_index:start_index + step])
-        found_names = names_extractor.extract_names(source_str, source_ref, exclude_names_file)
+    source_strs = [' '.join(texts[start_index:start_index + WINDOW_SIZE])
+                   for start_index in range(0, len(texts), WINDOW_SIZE)]
 
-        # extract names to JSON file
+    # skip the windows whose texts were already processed by an earlier run
+    # (matching on the text hash, so windows re-run if the texts change)
 
-        names_extractor.extract_names_to_json(canto, chapter, found_names)
+    progress = load_progress(canto, chapter)
+    completed_hashes = set(progress["window_hashes"])
+    window_hashes = [hashlib.sha256(source_str.encode('utf-8')).hexdigest()
+                     for source_str in source_strs]
+    pending = [window for window, window_hash in enumerate(window_hashes)
+               if window_hash not in completed_hashes]
+
+    # feed the remaining windows into the name extractor
+
+    all_found_names = await extract_names_from_windows(
+        [source_strs[window] for window in pending], source_ref, exclusion_text, semaphore)
+
+    # save the names off the event loop, so other chapters keep running
+    # while the files are written and synced
+
+    await asyncio.to_thread(save_windows, canto, chapter, progress, pending,
+                            window_hashes, all_found_names)
 
-        # advance iter
+def get_names_from_chapter(canto: int, chapter: int):
+    asyncio.run(get_names_from_chapter_async(canto, chapter))
+
+async def get_names_from_sb_async():
+    # fetch the texts of every chapter of SB in one query, then process up
+    # to MAX_CONCURRENT_CHAPTERS at once, sharing one cap on model requests
+    # (each chapter writes its own files, so they do not contend)
+
+    all_texts = text_retriever.get_texts_from_all_chapters()
+    plan = sorted(all_texts)
+    request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    chapter_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHAPTERS)
+
+    async def process(canto, chapter):
+        async with chapter_semaphore:
+            await get_names_from_chapter_async(canto, chapter, request_semaphore,
+                                               all_texts[(canto, chapter)])
+
+    results = await asyncio.gather(*(process(canto, chapter) for canto, chapter in plan),
+                                   return_exceptions=True)
 
-        curr_iter += 1
+    # report the chapters that failed, which can be resumed by running again
+
+    for (canto, chapter), result in zip(plan, results):
+        if isinstance(result, BaseException):
+            print(f"Failed to get names from SB {canto}.{chapter}: {result}")
 
 def get_names_from_sb():
-    canto, chapter = 1, 1
-    while canto <= 12:
-        try:
-            get_names_from_chapter(canto, chapter)
-            chapter += 1
-        except ValueError:
-            canto, chapter = canto + 1, 1
-
-get_names_from_chapter(5, 2)
\ No newline at end of file
+    asyncio.run(get_names_from_sb_async())
+
+if __name__ == "__main__":
+    # run a single chapter, or all of SB if no chapter is given
+
+    parser = argparse.ArgumentParser(
+        description="Extract beautiful Sanskrit names from Srimad Bhagavatam.")
+    parser.add_argument("canto", type=int, nargs="?", default=5,
+                        help="the canto number (default: 5)")
+    parser.add_argument("chapter", type=int, nargs="?", default=2,
+                        help="the chapter number (default: 2)")
+    parser.add_argument("--all", action="store_true",
+                        help="extract names from every chapter of SB")
+    args = parser.parse_args()
+
+    if args.all:
+        get_names_from_sb()
+    else:
+        get_names_from_chapter(args.canto, args.chapter)
@@ -1,5 +1,41 @@
-import sqlite3, json, re
+import sqlite3, json, re, functools, os, pickle
 
+# the database file, and the on-disk cache of its chapter index
+
+_DB_PATH = 'gargamuni vedabase data.ivd'
+_CHAPTER_INDEX_PATH = 'sb_chapter_index.pkl'
+
+# index of (canto, chapter) -> (first text record, last text record),
+# built once from the chapter listing, or loaded from its on-disk cache
+
+_CHAPTER_INDEX: dict[tuple[int, int], tuple[int, int]] = {}
+_CHAPTER_TITLE_RE = re.compile(r'SB (\d+)\.(\d+):')
+
+# patterns for stripping markup and splitting a chapter into its texts
+
+_TAG_RE = re.compile(r'<.*?>')
+_SPLIT_RE = re.compile(r'\b(TEXT \d+|TEXTS \d+-\d+)\b')
+
+# a single connection to the database, opened lazily and kept for the
+# lifetime of the process
+
+_CONN = None
+
+def _get_conn() -> sqlite3.Connection:
+    """
+    Return the shared read-only connection to the
+    "gargamuni vedabase data.ivd" database, opening it on first use.
+    """
+
+    global _CONN
+    if _CONN is None:
+        _CONN = sqlite3.connect(_DB_PATH, check_same_thread=False)
+        _CONN.execute("PRAGMA cache_size=-65536")
+        _CONN.execute("PRAGMA mmap_size=268435456")
+        _CONN.execute("PRAGMA query_only=1")
+    return _CONN
+
+@functools.lru_cache(maxsize=1)
 def list_all_sb_chapters() -> list[tuple[str, str, int, int]]:
     """List all chapters from SB in the format (canto, 
     chapter, record_id) from the file named
@@ -12,10 +48,9 @@ def list_all_sb_chapters() -> list[tuple[str, str, int, int]]:
         first text, and the record of the chapter's last text.
     """
 
-    # connect to the SQLite database
+    # get a cursor on the shared database connection
 
-    garg = sqlite3.connect('gargamuni vedabase data.ivd')
-    cursor = garg.cursor()
+    cursor = _get_conn().cursor()
 
     # execute the query to get all chapters
 
@@ -37,26 +72,86 @@ def list_all_sb_chapters() -> list[tuple[str, str, int, int]]:
     print(f"Found {len(chapters)} chapters in SB.")
     print("Chapters saved to sb_chapters.json.")
 
-    # close the connection
+    # save the results to a JSON file, only when the index is first built
 
-    garg.close()
-
-    # save the results to a JSON file
-
-    with open('sb_chapters.json', 'w') as f:
-        json.dump(chapters, f, indent=4)
+    if not _CHAPTER_INDEX:
+        with open('sb_chapters.json', 'w') as f:
+            json.dump(chapters, f, indent=4)
 
     # return the list of chapters
 
     return chapters
 
+def _build_chapter_index() -> dict[tuple[int, int], tuple[int, int]]:
+    """
+    Build the chapter index on first use, loading it from the pickled
+    cache if the database has not been modified since the cache was
+    written, and otherwise from list_all_sb_chapters, refreshing the cache.
+
+    Returns:
+        The index of (canto, chapter) to (first text record, last text record).
+    """
+
+    if _CHAPTER_INDEX:
+        return _CHAPTER_INDEX
+
+    db_mtime = os.stat(_DB_PATH).st_mtime_ns
+
+    # load the cached index, if it is still valid for the database
+
+    try:
+        with open(_CHAPTER_INDEX_PATH, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['db_mtime'] == db_mtime:
+            _CHAPTER_INDEX.update(cached['index'])
+            return _CHAPTER_INDEX
+    except (FileNotFoundError, pickle.UnpicklingError, EOFError, KeyError, TypeError):
+        pass
+
+    # otherwise, parse the chapter titles once from the chapter listing
+
+    index = {}
+    for chapter_set in list_all_sb_chapters():
+        match = _CHAPTER_TITLE_RE.search(chapter_set[1])
+        if match:
+            key = (int(match.group(1)), int(match.group(2)))
+            index.setdefault(key, (chapter_set[2], chapter_set[3]))
+
+    # save the index for later runs
+
+    with open(_CHAPTER_INDEX_PATH, 'wb') as f:
+        pickle.dump({'db_mtime': db_mtime, 'index': index}, f)
+
+    _CHAPTER_INDEX.update(index)
+    return _CHAPTER_INDEX
+
+def _chapter_records(canto: int, chapter: int) -> tuple[int, int]:
+    """
+    Look up the first and last text records of a chapter.
+
+    Raises:
+        KeyError: If the canto or chapter is not found.
+    """
+
+    return _build_chapter_index()[(canto, chapter)]
+
+def list_sb_chapter_numbers() -> list[tuple[int, int]]:
+    """
+    List every (canto, chapter) pair in SB, in order.
+
+    Returns:
+        A sorted list of (canto, chapter) tuples from the chapter index.
+    """
+
+    return sorted(_build_chapter_index())
+
 def get_texts_from_chapter(canto: int, chapter: int) -> list[str]:
     """
     Given a canto and chapter from SB, retrieve the full text for each 
     text in a list, converting the text data into plain text without the 
     stylistic elements, for example: [“Text 1.1.1 …”, “Text 1.1.2 ….”, …]
 
-    Uses the list_all_sb_chapters function to retrieve the chapter location
+    Uses the cached chapter index to retrieve the chapter location
     and then retrieves the texts from the database, using the record from
     the next_sibling field to determine the end of the chapter.
 
@@ -73,75 +168,117 @@ def get_texts_from_chapter(canto: int, chapter: int) -> list[str]:
 
     canto_chapter = f"SB {canto}.{chapter}:"
 
-    # retrieve the chapters and save it in a variable
+    # find the records for the first and last text of the chapter
+
+    try:
+        first_text_record, last_text_record = _chapter_records(canto, chapter)
+    except KeyError:
+        # if the chapter is not found, raise an error
+        raise ValueError(f"{canto_chapter} not found in SB.") from None
+
+    # get a cursor on the shared database connection
+
+    cursor = _get_conn().cursor()
+
+    # find the texts
+
+    cursor.execute(
+        "SELECT plain FROM texts WHERE recid BETWEEN ? AND ?",
+        (first_text_record, last_text_record)
+        )
+    
+    # format the texts and split them into individual texts
+
+    return _format_texts(plain for (plain,) in cursor)
 
-    chapters = list_all_sb_chapters()
+def get_texts_from_all_chapters() -> dict[tuple[int, int], list[str]]:
+    """
+    Retrieve the texts of every chapter in SB at once, in the same format
+    as get_texts_from_chapter, with a single query over the whole range of
+    records instead of one query per chapter.
 
-    # find the chapter, and its relevant texts, concatenated
+    Returns:
+        A dictionary from (canto, chapter) to the chapter's formatted texts.
+    """
 
-    for chapter_set in chapters:
-        if canto_chapter in chapter_set[1]:
-            # find the records for the first and last text of the chapter
+    # sort the chapters by their first record, to walk them alongside the rows
 
-            first_text_record, last_text_record = chapter_set[2], chapter_set[3]
+    ranges = sorted(
+        (first, last, key) for key, (first, last) in _build_chapter_index().items()
+        )
+    if not ranges:
+        return {}
 
-            # initialize the connection to the database
+    min_recid = ranges[0][0]
+    max_recid = max(last for _, last, _ in ranges)
 
-            garg = sqlite3.connect('gargamuni vedabase data.ivd')
-            cursor = garg.cursor()
+    # fetch every text in one sequential pass
 
-            # find the texts
+    cursor = _get_conn().cursor()
+    cursor.execute(
+        "SELECT recid, plain FROM texts WHERE recid BETWEEN ? AND ? ORDER BY recid",
+        (min_recid, max_recid)
+        )
+
+    '''
+    bucket the rows by chapter, keeping a pointer to the first chapter
+    that has not ended yet; since a chapter's last record is the next
+    chapter's first, a row can belong to more than one chapter
+    '''
 
-            cursor.execute(
-                f"SELECT plain FROM texts WHERE recid >= {first_text_record} " \
-                f"AND recid <= {last_text_record} " \
-                )
-            unformatted_texts = cursor.fetchall()
-            
-            '''
-            format the texts by removing all text that is in BETWEEN
-            brackets "<" and ">", in general
-            '''
+    buckets = {key: [] for _, _, key in ranges}
+    pointer = 0
+    for recid, plain in cursor:
+        while pointer < len(ranges) and ranges[pointer][1] < recid:
+            pointer += 1
 
-            formatted_texts = []
-            for text in unformatted_texts:
-                # remove the text between < and >
-                formatted_text = re.sub(r'<.*?>', ' ', text[0])
-                # add the formatted text to the list
-                formatted_texts.append(formatted_text)
+        index = pointer
+        while index < len(ranges) and ranges[index][0] <= recid:
+            if recid <= ranges[index][1]:
+                buckets[ranges[index][2]].append(plain)
+            index += 1
 
-            '''
-            next, proceed to concatenate the texts into a single string,
-            then split it into pieces wherever they start with the string
-            "TEXT (number)" or "TEXTS (number - number)", making sure that 
-            each split piece still starts with the relevant "TEXT " or 
-            "TEXTS " string, and that the split pieces are not empty
-            '''
-            
-            # concatenate the formatted texts into a single string
+    # format each chapter's texts
 
-            concatenated_text = ' '.join(formatted_texts)
+    return {key: _format_texts(plains) for key, plains in buckets.items()}
+
+def _format_texts(plains) -> list[str]:
+    """
+    Strip the markup from a chapter's raw texts and split them into
+    individual texts, each starting with its "TEXT " or "TEXTS " header.
 
-            # split the concatenated text into pieces
+    Args:
+        plains: The raw texts of the chapter, in record order.
+    Returns:
+        The formatted texts.
+    """
 
-            split_texts = re.split(r'\b(TEXT \d+|TEXTS \d+-\d+)\b', concatenated_text)
+    '''
+    concatenate the raw texts into a single string, then format it by
+    removing all text that is in BETWEEN brackets "<" and ">", in general,
+    in one pass over the whole chapter
+    '''
 
-            '''
-            strip whitespace from each piece and filter out empty strings,
-            also making sure that each piece starts with "TEXT " or "TEXTS "
-            and that it is not empty
-            '''
+    concatenated_text = _TAG_RE.sub(' ', ' '.join(plains))
 
-            split_texts = [piece.strip() for piece in split_texts if piece.strip().startswith(('TEXT ', 'TEXTS '))]
+    '''
+    next, split the text into pieces wherever they start with the string
+    "TEXT (number)" or "TEXTS (number - number)", making sure that 
+    each split piece still starts with the relevant "TEXT " or 
+    "TEXTS " string, and that the split pieces are not empty
+    '''
 
-            # close the connection
+    # locate every text header, and slice the concatenated text from
+    # each header up to the next one, so every piece starts with its header
 
-            garg.close()
+    matches = list(_SPLIT_RE.finditer(concatenated_text))
+    ends = [match.start() for match in matches[1:]] + [len(concatenated_text)]
 
-            # return the formatted texts
+    split_texts = [
+        concatenated_text[match.start():end].strip()
+        for match, end in zip(matches, ends)
+        ]
 
-            return split_texts
-        
-    # if the chapter is not found, raise an error
+    # return the formatted texts
 
-    raise ValueError(f"{canto_chapter} not found in SB.")
\ No newline at end of file
+    return split_texts
\ No newline at end of file